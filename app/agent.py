@@ -1,13 +1,22 @@
 from __future__ import annotations
 
+import asyncio
+import contextvars
+import functools
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict
 
+from app import pii
 from app.docs_loader import DocsLoader
 from app.llm import LLMClient, LLMUnavailableError
 from app.logger import TraceLogger
 from app.router import Router
 from app.sql_executor import PIIBlockError, SQLExecutor
 
+# Shared by all agents so per-request Agent instances don't each spawn worker threads.
+_PREFETCH_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="agent-prefetch")
+
 
 class Agent:
     def __init__(
@@ -17,29 +26,58 @@ class Agent:
         logger: TraceLogger | None = None,
         record_events: bool = False,
     ) -> None:
+        self.db_path = db_path
         self.logger = logger or TraceLogger(log_path=log_path, record_events=record_events)
         self.llm = LLMClient(logger=self.logger)
         self.router = Router(self.llm, self.logger)
-        self.docs = DocsLoader()
-        self.sql = SQLExecutor(db_path, self.llm, self.logger)
+
+    @functools.cached_property
+    def docs(self) -> DocsLoader:
+        return DocsLoader()
+
+    @functools.cached_property
+    def sql(self) -> SQLExecutor:
+        return SQLExecutor(self.db_path, self.llm, self.logger)
+
+    def classify_batch(self, queries: list[str]) -> list[Dict[str, Any]]:
+        """Route many queries at once via the OpenAI Batch API (for evals/backfills)."""
+        routes = self.router.route_batch(queries, policy_text=self.docs.extract_rule(""))
+        return [{"query": query, **route} for query, route in zip(queries, routes)]
 
     def handle(self, query: str) -> Dict[str, Any]:
+        return asyncio.run(self.handle_async(query))
+
+    async def handle_async(self, query: str) -> Dict[str, Any]:
+        with self.logger.batch():
+            return await self._handle(query)
+
+    async def _handle(self, query: str) -> Dict[str, Any]:
         try:
             self.logger.log("agent_handle_start", query=query)
-            pii_terms = self._detect_pii_terms(query)
+            pii_terms = pii.detect(query)
             if pii_terms:
                 raise PIIBlockError("Raw PII requested; request blocked.", pii_terms)
 
-            route_info = self.router.route(query)
+            # Schema introspection starts before routing and overlaps with the classifier round trip.
+            loop = asyncio.get_running_loop()
+            # Run in a copy of this request's context so its trace capture/batching still applies.
+            schema_future = loop.run_in_executor(
+                _PREFETCH_POOL, contextvars.copy_context().run, self._prefetch_schema
+            )
+            # The policy text is already in memory, so it is read inline rather than queued.
+            route_info = await self.router.route_async(query, policy_text=self.docs.extract_rule(query))
             decision = str(route_info.get("decision") or "docs")
+            snippet = str(route_info.get("policy_snippet") or "")
 
             if route_info.get("unknown"):
                 return {"message": "I couldn't understand that request. Please rephrase or ask a specific question."}
             if decision == "docs":
-                return self._handle_docs_case(query)
+                return await self._handle_docs_case(query, snippet)
+            # Only the SQL routes need the schema; docs answers never wait on the database.
+            schema = await schema_future
             if decision == "hybrid":
-                return self._handle_hybrid_case(query)
-            return self._handle_sql_case(query)
+                return await self._handle_hybrid_case(query, schema, snippet)
+            return await self._handle_sql_case(query, schema)
         except PIIBlockError as exc:
             self.logger.log(
                 "pii_block_result",
@@ -59,14 +97,26 @@ class Agent:
         except LLMUnavailableError as exc:
             self.logger.log("llm_unavailable", message=str(exc))
             return {"message": str(exc)}
+        except sqlite3.Error as exc:
+            self.logger.log("database_unavailable", query=query, error=str(exc))
+            return {
+                "error": str(exc),
+                "message": "The database is unavailable right now, so I can't answer data questions.",
+            }
 
-    def _detect_pii_terms(self, query: str) -> list[str]:
-        lowered = query.lower()
-        return [term for term in ["email", "phone", "address", "pii"] if term in lowered]
+    def _prefetch_schema(self) -> str:
+        """Schema summary for the SQL routes; a missing/unreadable DB must not fail docs queries."""
+        try:
+            return self.sql.schema_summary()
+        except sqlite3.Error as exc:
+            self.logger.log("schema_prefetch_error", error=str(exc))
+            return ""
 
-    def _handle_docs_case(self, query: str) -> Dict[str, Any]:
-        context = self._retrieve_policy_context(query, stage="doc1_policy_retrieval_result")
-        answer = self.llm.answer_from_docs(query, context)
+    async def _handle_docs_case(self, query: str, snippet: str = "") -> Dict[str, Any]:
+        context = await self._retrieve_policy_context(query, stage="doc1_policy_retrieval_result", snippet=snippet)
+        # Anything short of the whole document was selected for this question.
+        narrowed = context.strip() != self.docs.extract_rule(query).strip()
+        answer = await self.llm.answer_from_docs_async(query, context, narrowed=narrowed)
         self.logger.log(
             "doc_final_answer_result",
             mode="docs",
@@ -76,14 +126,13 @@ class Agent:
         )
         return {"message": answer}
 
-    def _handle_sql_case(self, query: str) -> Dict[str, Any]:
-        schema = self.sql.schema_summary()
-        sql = self._generate_sql(
+    async def _handle_sql_case(self, query: str, schema: str) -> Dict[str, Any]:
+        sql = await self._generate_sql(
             query,
             schema=schema,
             stage="sql1_generation_result",
         )
-        result = self._run_sql_pipeline(sql, schema=schema, query=query)
+        result = await self._run_sql_pipeline(sql, schema=schema, query=query)
         self.logger.log(
             "sql_final_answer_result",
             mode="sql",
@@ -93,22 +142,25 @@ class Agent:
         )
         return {"result": result}
 
-    def _handle_hybrid_case(self, query: str) -> Dict[str, Any]:
-        policy_context = self._retrieve_policy_context(query, stage="h1_policy_extraction_result")
+    async def _handle_hybrid_case(self, query: str, schema: str, snippet: str = "") -> Dict[str, Any]:
+        policy_context = await self._retrieve_policy_context(
+            query,
+            stage="h1_policy_extraction_result",
+            snippet=snippet,
+        )
         self.logger.log(
             "h1_policy_answer_result",
             query=query,
             has_context=bool(policy_context.strip()),
             answer_preview=policy_context.strip()[:200],
         )
-        schema = self.sql.schema_summary()
-        sql = self._generate_sql(
+        sql = await self._generate_sql(
             query,
             schema=schema,
             business_rule=policy_context,
             stage="h2_sql_generation_result",
         )
-        result = self._run_sql_pipeline(sql, schema=schema, query=query)
+        result = await self._run_sql_pipeline(sql, schema=schema, query=query)
         self.logger.log(
             "h5_final_answer_result",
             mode="hybrid",
@@ -118,9 +170,13 @@ class Agent:
         )
         return {"result": result}
 
-    def _retrieve_policy_context(self, query: str, stage: str) -> str:
+    async def _retrieve_policy_context(self, query: str, stage: str, snippet: str = "") -> str:
+        if snippet.strip():
+            # The router already extracted the relevant policy in its classification call.
+            self.logger.log(stage, source="router", has_context=True, context_chars=len(snippet))
+            return snippet
         full_context = self.docs.extract_rule(query)
-        selected = self.llm.select_policy_context(query, full_context, fallback=full_context)
+        selected = await self.llm.select_policy_context_async(query, full_context, fallback=full_context)
         self.logger.log(
             "h2_llm_policy_context_selection_result",
             selected=selected,
@@ -129,8 +185,8 @@ class Agent:
         )
         return selected if selected else full_context
 
-    def _generate_sql(self, query: str, *, schema: str, business_rule: str = "", stage: str) -> str:
-        sql = self.llm.generate_sql(query, business_rule=business_rule, schema=schema)
+    async def _generate_sql(self, query: str, *, schema: str, business_rule: str = "", stage: str) -> str:
+        sql = await self.llm.generate_sql_async(query, business_rule=business_rule, schema=schema)
         self.logger.log(
             stage,
             business_rule=business_rule,
@@ -138,7 +194,7 @@ class Agent:
         )
         return sql
 
-    def _run_sql_pipeline(self, sql: str, *, schema: str, query: str) -> Dict[str, Any]:
+    async def _run_sql_pipeline(self, sql: str, *, schema: str, query: str) -> Dict[str, Any]:
         sql_preview = sql.strip()[:200]
         self.logger.log(
             "sql2_self_correction_sql_execution_loop_start",
@@ -147,7 +203,7 @@ class Agent:
             sql_preview=sql_preview,
             schema_chars=len(schema),
         )
-        result = self.sql.execute_with_retry(sql, schema=schema)
+        result = await self.sql.execute_with_retry_async(sql, schema=schema)
         rows = result.get("rows") if isinstance(result, dict) else None
         status = "success" if rows is not None else "error"
         self.logger.log(
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import functools
 from dataclasses import dataclass
 from pathlib import Path
 from typing import List
@@ -7,6 +8,12 @@ from typing import List
 from app.utils import keyword_match
 
 
+@functools.lru_cache(maxsize=8)
+def _cached_load(path: str, mtime: float) -> str:
+    """Read a policy file once per (path, mtime) so new loaders reuse the same string."""
+    return Path(path).read_text(encoding="utf-8")
+
+
 @dataclass
 class PolicyDoc:
     content: str
@@ -24,7 +31,7 @@ class DocsLoader:
     def _load(self) -> str:
         if not self.path.exists():
             return ""
-        return self.path.read_text(encoding="utf-8")
+        return _cached_load(str(self.path), self.path.stat().st_mtime)
 
     def extract_rule(self, question: str) -> str:
         return self.doc.content
@@ -1,64 +1,170 @@
 from __future__ import annotations
 
+import asyncio
+import functools
+import hashlib
 import os
 import json
-from dataclasses import dataclass
-from typing import Any, Dict, Optional
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import closing
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
 
 from app.logger import TraceLogger
-from app.utils import keyword_match
+from app.utils import extract_sql, keyword_match, policy_term_pattern, sql_statement_end, truncate_relevant
 
 try:
-    from openai import OpenAI
+    from openai import AsyncOpenAI, OpenAI
 except ImportError:
+    AsyncOpenAI = None  # type: ignore
     OpenAI = None  # type: ignore
 
+try:
+    import numpy as np
+except ImportError:
+    np = None  # type: ignore
+
 
 SYSTEM_ROUTER_PROMPT = """
-You are a tool routing classifier.
-Determine whether the user query requires database SQL, business policy lookup, or both.
-If the query is nonsense, empty, or unrelated, mark it as unknown.
-
-Definitions:
-- SQL: direct DB queries, counts, sums, joins, filters.
-- Policy: business rules defined in policies.md (VIP rules, return rules, restocking fee, shipping rules)
-- Unknown: junk/unrelated/empty input; do not route to SQL or policy.
-
-Output ONLY a function call with:
-{
-   "requires_sql": true/false,
-   "requires_policy": true/false,
-   "unknown": true/false,
-   "explanation": "brief reasoning"
-}
+Classify the query. Output JSON: requires_sql, requires_policy, unknown (booleans), relevant_policy_snippet (string).
+SQL = store database queries. Policy = VIP/return/refund/shipping/restocking rules. Unknown = nonsense (both flags false).
+relevant_policy_snippet = verbatim policy sentences when a policy document is given and needed, else "".
 """.strip()
 
-CLASSIFY_SCHEMA = {
-    "type": "object",
-    "properties": {
-        "requires_sql": {"type": "boolean"},
-        "requires_policy": {"type": "boolean"},
-        "explanation": {"type": "string"},
-        "unknown": {"type": "boolean"},
-    },
-    "required": ["requires_sql", "requires_policy"],
-}
+# Classification is a small structured task, so it runs on a cheaper/faster model.
+CLASSIFIER_MODEL = "gpt-4.1-nano"
+
+
+POLICY_TERMS = ("policy", "rule", "guideline", "vip", "refund", "return", "shipping", "restocking")
+_POLICY_RE = policy_term_pattern(POLICY_TERMS)
+
+# Fast-path routing: unambiguous queries skip the classifier round trip.
+_SQL_VERB_RE = re.compile(r"\b(?:count|sum|avg|average|total|join|how many)\b", re.IGNORECASE)
+# Weaker data signals: they block the docs fast path and confirm a hybrid, but never route alone.
+_DATA_TERM_RE = re.compile(r"\b(?:list|show|customers?|orders?|products?|revenue|sales)\b", re.IGNORECASE)
+
+_SELECT_RE = re.compile(r"select\b", re.IGNORECASE)
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+SEMANTIC_CACHE_THRESHOLD = 0.92
 
 
 class LLMUnavailableError(RuntimeError):
     """Raised when the LLM client is not configured or reachable."""
 
 
-@dataclass
+class SemanticCache:
+    """
+    Response cache for LLM calls.
+    Exact hits are keyed by (method, normalized query, context); misses fall back to
+    cosine similarity against cached query embeddings that share the same method/context.
+    """
+
+    def __init__(
+        self,
+        path: str | None = "logs/llm_cache.jsonl",
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+    ) -> None:
+        self.path = Path(path) if path else None
+        self.threshold = threshold
+        self._exact: Dict[str, str] = {}
+        self._vectors: Dict[str, List[Tuple[Any, str]]] = {}
+        self._matrices: Dict[str, Any] = {}
+        self._load()
+
+    @staticmethod
+    def _digest(*parts: str) -> str:
+        return hashlib.blake2b("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def scope(self, method: str, context: str) -> str:
+        return self._digest(method, context)
+
+    def key(self, scope: str, query: str) -> str:
+        return self._digest(scope, query.lower().strip())
+
+    def get(self, scope: str, query: str) -> Optional[str]:
+        return self._exact.get(self.key(scope, query))
+
+    def get_similar(self, scope: str, embedding: Optional[List[float]]) -> Optional[str]:
+        entries = self._vectors.get(scope)
+        if np is None or embedding is None or not entries:
+            return None
+        matrix = self._matrices.get(scope)
+        if matrix is None:
+            matrix = np.stack([vector for vector, _ in entries])
+            self._matrices[scope] = matrix
+        scores = matrix @ self._normalize(embedding)
+        best = int(scores.argmax())
+        if float(scores[best]) >= self.threshold:
+            return entries[best][1]
+        return None
+
+    def put(self, scope: str, query: str, response: str, embedding: Optional[List[float]] = None) -> None:
+        key = self.key(scope, query)
+        self._store(key, scope, response, embedding)
+        if not self.path:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        record = {"key": key, "scope": scope, "response": response, "embedding": embedding}
+        with self.path.open("a", encoding="utf-8") as handle:
+            handle.write(json.dumps(record) + "\n")
+
+    def _store(self, key: str, scope: str, response: str, embedding: Optional[List[float]]) -> None:
+        self._exact[key] = response
+        if np is not None and embedding:
+            self._vectors.setdefault(scope, []).append((self._normalize(embedding), response))
+            self._matrices.pop(scope, None)
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> Any:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+    def _load(self) -> None:
+        if not self.path or not self.path.exists():
+            return
+        with self.path.open("r", encoding="utf-8") as handle:
+            for line in handle:
+                try:
+                    record = json.loads(line)
+                    self._store(record["key"], record["scope"], record["response"], record.get("embedding"))
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    continue
+
+
+@dataclass(slots=True, frozen=True)
 class Classification:
     requires_sql: bool
     requires_policy: bool
-    explanation: str = ""
     source: str = "llm"
     unknown: bool = False
+    policy_snippet: str = ""
+    decision: str = field(init=False)
+    # Fields never change after construction, so the dict form is built once.
+    _payload: Dict[str, Any] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "decision", self._decide())
+        object.__setattr__(
+            self,
+            "_payload",
+            {
+                "requires_sql": self.requires_sql,
+                "requires_policy": self.requires_policy,
+                "decision": self.decision,
+                "source": self.source,
+                "unknown": self.unknown,
+                "policy_snippet": self.policy_snippet,
+            },
+        )
 
-    @property
-    def decision(self) -> str:
+    def _decide(self) -> str:
         if self.unknown:
             return "unknown"
         if self.requires_sql and self.requires_policy:
@@ -70,171 +176,791 @@ class Classification:
         return "docs"
 
     def to_dict(self) -> Dict[str, Any]:
-        return {
-            "requires_sql": self.requires_sql,
-            "requires_policy": self.requires_policy,
-            "explanation": self.explanation,
-            "decision": self.decision,
-            "source": self.source,
-            "unknown": self.unknown,
-        }
+        return dict(self._payload)
 
 
 def _has_key() -> bool:
     return bool(os.getenv("OPENAI_API_KEY")) and OpenAI is not None
 
 
+# Prompts keep static instructions (and schema/policy text) in the leading system message and
+# the per-request input last, so OpenAI's automatic prefix caching can reuse the prefix.
+SQL_SYSTEM_PROMPT = (
+    "You are a SQLite expert. Generate safe SELECT-only SQL. "
+    "Return only the SQL statement with no explanation. "
+    "Never include raw email, phone, or address unless needed for joins; prefer aggregated or masked data. "
+    "When a business rule is provided, you must encode every constraint from that rule into the SQL "
+    "(e.g., VIP definition thresholds, date windows, spend minimums). "
+    "Do not drop rule constraints even if the user query omits them. "
+    "Use only the tables and columns listed in the provided schema. "
+    "If the request cannot be satisfied with the available tables, return a empty string."
+)
+
+CORRECT_SQL_SYSTEM_PROMPT = (
+    "You are helping fix a SQLite query. Return only corrected SQL. "
+    "Do not include explanations. "
+    "Use only the tables/columns in the provided schema; if the requested table does not exist, "
+    "return a safe placeholder like SELECT 'no matching table' AS message;"
+)
+
+DOCS_SYSTEM_PROMPT = (
+    "You are a compliance/policy assistant. Answer the question strictly using the provided policy snippets. "
+    "If the policy does not contain the answer, say you do not have that information."
+)
+
+POLICY_FILTER_SYSTEM_PROMPT = (
+    "You are a retrieval filter. Given a policy document and a user question, "
+    "return relevant sentences/paragraphs from document regarding the question. "
+    "Do not invent content. If nothing is relevant, return an empty string."
+)
+
+# Retries use the OpenAI SDK's built-in exponential backoff.
+LLM_MAX_RETRIES = 3
+# Upper bound on schema / business-rule text sent with SQL generation prompts.
+PROMPT_CONTEXT_MAX_CHARS = 4000
+# Batch API jobs are polled at this interval (seconds) until they finish.
+BATCH_POLL_SECONDS = 30.0
+# Streamed policy answers are cut off once they reach this many characters.
+ANSWER_MAX_CHARS = 4000
+# Policy documents shorter than this are passed through whole instead of LLM-filtered.
+SMALL_POLICY_CHARS = 2000
+
+# "show me the return policy" style requests are answered with the policy text itself.
+_VERBATIM_POLICY_RE = re.compile(
+    r"^\s*(?:show|give|display|print)(?: me)? (?:the )?(?:\w+ )?(?:polic(?:y|ies)|rules?|guidelines?)\s*\??\s*$",
+    re.IGNORECASE,
+)
+
+
+class _SingleFlight:
+    """Collapse concurrent identical calls onto the first caller's in-flight result."""
+
+    # Result handed to followers when the leader was interrupted (e.g. cancelled) rather
+    # than failed: they rejoin, and one of them becomes the new leader and retries.
+    _RETRY = object()
+
+    def __init__(self) -> None:
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key: str) -> Tuple[Future, bool]:
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+            return future, True
+
+    def _settle(self, key: str, future: Future, result: Any = None, error: BaseException | None = None) -> None:
+        with self._lock:
+            self._inflight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        while True:
+            future, leader = self._join(key)
+            if not leader:
+                result = future.result()
+                if result is self._RETRY:
+                    continue
+                return result
+            try:
+                result = fn()
+            except Exception as exc:
+                self._settle(key, future, error=exc)
+                raise
+            except BaseException:
+                self._settle(key, future, self._RETRY)
+                raise
+            self._settle(key, future, result)
+            return result
+
+    async def do_async(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        while True:
+            future, leader = self._join(key)
+            if not leader:
+                result = await asyncio.wrap_future(future)
+                if result is self._RETRY:
+                    continue
+                return result
+            try:
+                result = await fn()
+            except Exception as exc:
+                self._settle(key, future, error=exc)
+                raise
+            except BaseException:
+                # CancelledError only means this caller gave up; followers still want the result.
+                self._settle(key, future, self._RETRY)
+                raise
+            self._settle(key, future, result)
+            return result
+
+
+# Shared across LLMClient instances so per-request agents also dedupe against each other.
+_INFLIGHT = _SingleFlight()
+
+
+class _ClassificationCache:
+    """Thread-safe LRU of LLM classifications keyed by (model, normalized query, policy text)."""
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Tuple[str, str, str], Classification]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str, str]) -> Optional[Classification]:
+        with self._lock:
+            hit = self._entries.get(key)
+            if hit is not None:
+                self._entries.move_to_end(key)
+            return hit
+
+    def put(self, key: Tuple[str, str, str], classification: Classification) -> None:
+        with self._lock:
+            self._entries[key] = classification
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+_CLASSIFICATIONS = _ClassificationCache()
+
+
+@functools.lru_cache(maxsize=4)
+def _get_openai_client(api_key: str) -> Any:
+    """Share one OpenAI client (and its connection pool) per API key."""
+    return OpenAI(api_key=api_key, max_retries=LLM_MAX_RETRIES)
+
+
+_async_client_slot: Tuple[Any, str, Any] | None = None
+
+
+def _get_async_openai_client(api_key: str) -> Any:
+    """Share one AsyncOpenAI client per API key within the running event loop."""
+    global _async_client_slot
+    loop = asyncio.get_running_loop()
+    slot = _async_client_slot
+    if slot is not None and slot[0] is loop and slot[1] == api_key:
+        return slot[2]
+    # httpx connection pools cannot be shared across event loops.
+    client = AsyncOpenAI(api_key=api_key, max_retries=LLM_MAX_RETRIES)
+    _async_client_slot = (loop, api_key, client)
+    return client
+
+
 class LLMClient:
-    def __init__(self, model: str = "gpt-4o-mini", logger: TraceLogger | None = None) -> None:
+    def __init__(
+        self,
+        model: str = "gpt-4o-mini",
+        logger: TraceLogger | None = None,
+        cache_path: str | None = "logs/llm_cache.jsonl",
+        classifier_model: str = CLASSIFIER_MODEL,
+    ) -> None:
         self.model = model
+        self.classifier_model = classifier_model
         self.available = _has_key()
-        self.client = OpenAI() if self.available else None
+        self.client = _get_openai_client(os.environ["OPENAI_API_KEY"]) if self.available else None
         self.logger = logger
-        self.policy_terms = [
-            "policy",
-            "rule",
-            "guideline",
-            "vip",
-            "refund",
-            "return",
-            "shipping",
-            "restocking",
-        ]
+        self.cache = SemanticCache(cache_path) if cache_path else None
+        self.policy_terms = list(POLICY_TERMS)
 
     def _ensure_available(self) -> None:
         if not self.client:
             raise LLMUnavailableError("LLM unavailable: set OPENAI_API_KEY and retry.")
 
-    def _chat(self, messages: Any, tools: Optional[list] = None) -> Dict[str, Any]:
+    def _aclient(self) -> Any:
+        """Return an AsyncOpenAI client bound to the running event loop."""
+        self._ensure_available()
+        return _get_async_openai_client(os.environ["OPENAI_API_KEY"])
+
+    def _flight_key(self, kind: str, messages: Any, model: str | None = None) -> str:
+        raw = json.dumps([kind, model or self.model, messages], sort_keys=True)
+        return hashlib.blake2b(raw.encode("utf-8")).hexdigest()
+
+    def _chat(self, messages: Any) -> Dict[str, Any]:
+        """JSON-mode completion on the classifier model."""
+        self._ensure_available()
+        key = self._flight_key("chat", messages, self.classifier_model)
+        return _INFLIGHT.do(key, lambda: self._request_chat(messages))
+
+    async def _chat_async(self, messages: Any) -> Dict[str, Any]:
+        key = self._flight_key("chat", messages, self.classifier_model)
+        return await _INFLIGHT.do_async(key, lambda: self._request_chat_async(messages))
+
+    def _stream(self, messages: Any, stop: Callable[[str], bool]) -> str:
+        """Stream a completion, closing the stream as soon as stop(text) is satisfied."""
         self._ensure_available()
+        key = self._flight_key(f"stream:{stop.__name__}", messages)
+        return _INFLIGHT.do(key, lambda: self._request_stream(messages, stop))
+
+    async def _stream_async(self, messages: Any, stop: Callable[[str], bool]) -> str:
+        key = self._flight_key(f"stream:{stop.__name__}", messages)
+        return await _INFLIGHT.do_async(key, lambda: self._request_stream_async(messages, stop))
+
+    def _request_chat(self, messages: Any) -> Dict[str, Any]:
         response = self.client.chat.completions.create(
-            model=self.model,
+            model=self.classifier_model,
+            messages=messages,
+            response_format={"type": "json_object"},
+        )
+        self._log_usage(response)
+        return response.to_dict()
+
+    async def _request_chat_async(self, messages: Any) -> Dict[str, Any]:
+        response = await self._aclient().chat.completions.create(
+            model=self.classifier_model,
             messages=messages,
-            tools=tools,
-            tool_choice="auto",
+            response_format={"type": "json_object"},
         )
+        self._log_usage(response)
         return response.to_dict()
 
+    def _complete(self, messages: Any) -> str:
+        resp = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+        )
+        self._log_usage(resp)
+        return resp.choices[0].message.content or ""
+
+    async def _complete_async(self, messages: Any) -> str:
+        resp = await self._aclient().chat.completions.create(
+            model=self.model,
+            messages=messages,
+        )
+        self._log_usage(resp)
+        return resp.choices[0].message.content or ""
+
+    def _log_usage(self, response: Any) -> None:
+        """Trace prompt-cache effectiveness (cached_tokens > 0 means the static prefix was reused)."""
+        usage = getattr(response, "usage", None)
+        if not self.logger or usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        self.logger.log(
+            "llm_usage",
+            prompt_tokens=usage.prompt_tokens,
+            cached_tokens=getattr(details, "cached_tokens", 0) or 0,
+        )
+
+    def _iter_stream(self, messages: Any) -> Iterator[str]:
+        """Yield completion text deltas as they arrive; closing the generator closes the stream."""
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    # The final chunk carries only usage (absent when the stream is closed early).
+                    self._log_usage(chunk)
+                elif chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            stream.close()
+
+    def _request_stream(self, messages: Any, stop: Callable[[str], bool]) -> str:
+        text = ""
+        with closing(self._iter_stream(messages)) as deltas:
+            for delta in deltas:
+                text += delta
+                if stop(text):
+                    break
+        return text
+
+    async def _request_stream_async(self, messages: Any, stop: Callable[[str], bool]) -> str:
+        stream = await self._aclient().chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        text = ""
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    self._log_usage(chunk)
+                    continue
+                text += chunk.choices[0].delta.content or ""
+                if stop(text):
+                    break
+        finally:
+            await stream.close()
+        return text
+
+    @staticmethod
+    def _until_done(text: str) -> bool:
+        return False
+
+    @staticmethod
+    def _sql_complete(text: str) -> bool:
+        """True once a SELECT has been closed by a ';' outside any quoted literal."""
+        if ";" not in text:
+            return False
+        select = _SELECT_RE.search(text)
+        return select is not None and sql_statement_end(text, select.start()) != -1
+
+    @staticmethod
+    def _answer_budget_reached(text: str) -> bool:
+        return len(text) >= ANSWER_MAX_CHARS
+
+    def embed(self, text: str) -> Optional[List[float]]:
+        """Return the embedding for text, or None when embeddings are unavailable."""
+        if not self.client:
+            return None
+        try:
+            resp = self.client.embeddings.create(model=EMBEDDING_MODEL, input=text)
+        except Exception as exc:  # cache lookups must never fail the request
+            self._log_embedding_error(exc)
+            return None
+        return list(resp.data[0].embedding)
+
+    async def embed_async(self, text: str) -> Optional[List[float]]:
+        if not self.client:
+            return None
+        try:
+            resp = await self._aclient().embeddings.create(model=EMBEDDING_MODEL, input=text)
+        except Exception as exc:  # cache lookups must never fail the request
+            self._log_embedding_error(exc)
+            return None
+        return list(resp.data[0].embedding)
+
+    def _log_embedding_error(self, exc: Exception) -> None:
+        if self.logger:
+            self.logger.log("llm_embedding_error", error=str(exc))
+
+    def _cached(
+        self,
+        method: str,
+        query: str,
+        context: str,
+        compute: Callable[[], str],
+        semantic: bool = True,
+    ) -> str:
+        """Serve an LLM call from the response cache, computing and storing it on a miss."""
+        if self.cache is None:
+            return compute()
+        scope = self.cache.scope(method, context)
+        hit, source, embedding = self.cache.get(scope, query), "exact", None
+        # Without numpy get_similar can never hit, so the embedding call would be wasted.
+        if hit is None and semantic and np is not None:
+            embedding = self.embed(query)
+            hit, source = self.cache.get_similar(scope, embedding), "semantic"
+        self._log_cache(method, hit, source)
+        if hit is not None:
+            return hit
+        response = compute()
+        self.cache.put(scope, query, response, embedding)
+        return response
+
+    async def _cached_async(
+        self,
+        method: str,
+        query: str,
+        context: str,
+        compute: Callable[[], Awaitable[str]],
+        semantic: bool = True,
+    ) -> str:
+        if self.cache is None:
+            return await compute()
+        scope = self.cache.scope(method, context)
+        hit, source, embedding = self.cache.get(scope, query), "exact", None
+        if hit is None and semantic and np is not None:
+            embedding = await self.embed_async(query)
+            hit, source = self.cache.get_similar(scope, embedding), "semantic"
+        self._log_cache(method, hit, source)
+        if hit is not None:
+            return hit
+        response = await compute()
+        self.cache.put(scope, query, response, embedding)
+        return response
+
+    def _log_cache(self, method: str, hit: Optional[str], source: str) -> None:
+        if self.logger:
+            self.logger.log(
+                "llm_cache_result",
+                method=method,
+                hit=hit is not None,
+                source=source if hit is not None else None,
+            )
+
     # Router
-    def classify_tools(self, query: str, *, skip_policy_rule: bool = False) -> Dict[str, Any]:
+    def classify_tools(
+        self,
+        query: str,
+        *,
+        policy_text: str = "",
+    ) -> Dict[str, Any]:
         """
-        Final classification logic:
-        - policy keyword hit → requires_policy = True
-        - LLM decides requires_sql / requires_policy
-        - Final routing merges both
-
-        This avoids mistakes like:
-        "Give me the VIP definition" → docs (correct)
-        "List VIP customers" → hybrid (correct)
+        Classify a query: classification cache → deterministic fast path → LLM.
+
+        This is a pure classifier; merging in policy keyword hits (keyword OR LLM for
+        requires_policy, LLM only for requires_sql) happens in the Router alone.
+
+        When policy_text is given, the same call also returns the relevant policy
+        snippet, saving a separate select_policy_context round trip.
         """
+        key = self._classification_key(query, policy_text)
+        llm_cls = self._lookup_classification(key) or self._fast_classify(query)
+        if llm_cls is None:
+            llm_cls = self._classify_via_llm(query, policy_text)  # LLM classification
+            _CLASSIFICATIONS.put(key, llm_cls)
+        return self._log_classification(query, llm_cls)
 
-        # Step 1 — keyword-based detection (only affects requires_policy)
-        keyword_policy = False
-        if not skip_policy_rule:
-            keyword_policy = self._policy_keyword_hit(query)  # e.g., "VIP", "return", "restocking"
+    async def classify_tools_async(
+        self,
+        query: str,
+        *,
+        policy_text: str = "",
+    ) -> Dict[str, Any]:
+        local = self.classify_local(query, policy_text=policy_text)
+        if local is not None:
+            return local
+        return await self.classify_remote_async(query, policy_text=policy_text)
 
-        llm_cls = self._classify_via_llm(query)  # LLM classification
+    def classify_local(
+        self,
+        query: str,
+        *,
+        policy_text: str = "",
+    ) -> Optional[Dict[str, Any]]:
+        """Classify from the classification cache or the fast path; None means the LLM is needed."""
+        key = self._classification_key(query, policy_text)
+        llm_cls = self._lookup_classification(key) or self._fast_classify(query)
+        if llm_cls is None:
+            return None
+        return self._log_classification(query, llm_cls)
 
-        # Step 3 — Merge logic 
-        # Do NOT infer SQL from keyword hits!
-        # Policy keywords only imply requires_policy.
-        requires_policy = keyword_policy or llm_cls.requires_policy
+    async def classify_remote_async(
+        self,
+        query: str,
+        *,
+        policy_text: str = "",
+    ) -> Dict[str, Any]:
+        """Classify with the LLM, skipping the local layers (callers have already tried them)."""
+        llm_cls = await self._classify_via_llm_async(query, policy_text)
+        _CLASSIFICATIONS.put(self._classification_key(query, policy_text), llm_cls)
+        return self._log_classification(query, llm_cls)
 
-        # SQL requirement ALWAYS comes from LLM (never from keyword)
-        requires_sql = llm_cls.requires_sql
+    def classify_tools_batch(
+        self,
+        queries: List[str],
+        *,
+        policy_text: str = "",
+        poll_seconds: float = BATCH_POLL_SECONDS,
+    ) -> List[Classification]:
+        """
+        Classify many queries through the OpenAI Batch API (half price, higher throughput,
+        up to 24h turnaround). Cached and fast-path queries are resolved locally; only the
+        rest are submitted, and any the batch fails to answer are classified one by one.
+        Intended for offline evals/backfills, not interactive requests.
+        """
+        self._ensure_available()
+        resolved: Dict[str, Classification] = {}
+        pending: Dict[str, str] = {}
+        for query in queries:
+            key = self._classification_key(query, policy_text)
+            hit = _CLASSIFICATIONS.get(key) or self._fast_classify(query)
+            if hit is not None:
+                resolved[query] = hit
+            else:
+                pending[hashlib.blake2b(query.encode("utf-8")).hexdigest()] = query
 
-        # Step 4 — Final decision
-        final = Classification(
-            requires_sql=requires_sql,
-            requires_policy=requires_policy,
-            explanation=llm_cls.explanation,
-            unknown=llm_cls.unknown,
+        if pending:
+            results = self._run_batch(
+                {
+                    custom_id: {
+                        "model": self.classifier_model,
+                        "messages": self._classify_messages(query, policy_text),
+                        "response_format": {"type": "json_object"},
+                    }
+                    for custom_id, query in pending.items()
+                },
+                poll_seconds,
+            )
+            failed = [query for custom_id, query in pending.items() if custom_id not in results]
+            if failed and self.logger:
+                self.logger.log("llm_batch_fallback", failed=len(failed), submitted=len(pending))
+            for custom_id, query in pending.items():
+                body = results.get(custom_id)
+                # Missing/failed batch items are classified with a regular request instead of
+                # being given a default that is indistinguishable from a real answer.
+                classification = (
+                    self._parse_classification(body) if body is not None else self._classify_via_llm(query, policy_text)
+                )
+                resolved[query] = classification
+                _CLASSIFICATIONS.put(self._classification_key(query, policy_text), classification)
+
+        return [resolved[query] for query in queries]
+
+    def _run_batch(self, bodies: Dict[str, Dict[str, Any]], poll_seconds: float) -> Dict[str, Dict[str, Any]]:
+        """Submit chat-completion bodies as one batch job and return response bodies by custom_id."""
+        lines = [
+            json.dumps({"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body})
+            for custom_id, body in bodies.items()
+        ]
+        upload = self.client.files.create(
+            file=("batch.jsonl", ("\n".join(lines) + "\n").encode("utf-8")),
+            purpose="batch",
+        )
+        batch = self.client.batches.create(
+            input_file_id=upload.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
         )
+        if self.logger:
+            self.logger.log("llm_batch_submitted", batch_id=batch.id, requests=len(lines))
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            time.sleep(poll_seconds)
+            batch = self.client.batches.retrieve(batch.id)
+        if batch.status != "completed" or not batch.output_file_id:
+            raise LLMUnavailableError(f"Batch {batch.id} finished with status {batch.status}.")
 
-        return self._log_classification(query, final)
+        results: Dict[str, Dict[str, Any]] = {}
+        for line in self.client.files.content(batch.output_file_id).text.splitlines():
+            record = json.loads(line)
+            response = record.get("response") or {}
+            if response.get("status_code") == 200:
+                results[record["custom_id"]] = response["body"]
+        if self.logger:
+            self.logger.log(
+                "llm_batch_result",
+                batch_id=batch.id,
+                requests=len(lines),
+                succeeded=len(results),
+            )
+        return results
+
+    def _classification_key(self, query: str, policy_text: str) -> Tuple[str, str, str]:
+        # policy_text is the shared DocsLoader string, so its hash is computed only once.
+        return (self.classifier_model, " ".join(query.lower().split()), policy_text)
+
+    def _lookup_classification(self, key: Tuple[str, str, str]) -> Optional[Classification]:
+        hit = _CLASSIFICATIONS.get(key)
+        if self.logger:
+            self.logger.log("classification_cache_result", hit=hit is not None)
+        return hit
 
+    def _fast_classify(self, query: str) -> Optional[Classification]:
+        """
+        Deterministic, high-precision routing; return None to fall through to the LLM.
+
+        - policy keywords, no SQL verbs or data terms → docs
+        - SQL verbs, no policy keywords → sql
+        - SQL verbs, policy keywords and a data term → hybrid
+        """
+        policy_hit = self._policy_keyword_hit(query)
+        sql_hit = bool(_SQL_VERB_RE.search(query))
+        result: Optional[Classification] = None
+        if policy_hit and not sql_hit and not _DATA_TERM_RE.search(query):
+            result = Classification(
+                requires_sql=False,
+                requires_policy=True,
+                source="fast_path",
+            )
+        elif sql_hit and not policy_hit:
+            result = Classification(
+                requires_sql=True,
+                requires_policy=False,
+                source="fast_path",
+            )
+        elif sql_hit and _DATA_TERM_RE.search(query):
+            result = Classification(
+                requires_sql=True,
+                requires_policy=True,
+                source="fast_path",
+            )
+
+        if self.logger:
+            hits = self.logger.incr("fast_path_hits", int(result is not None))
+            total = self.logger.incr("fast_path_checks")
+            self.logger.log(
+                "fast_path_result",
+                query=query,
+                hit=result is not None,
+                decision=result.decision if result is not None else None,
+                hit_rate=round(hits / total, 3),
+            )
+        return result
 
     def extract_business_rule(self, question: str, fallback: str = "") -> str:
         self._ensure_available()
-        messages = [
+        return self._stream(self._business_rule_messages(question), self._until_done) or fallback
+
+    async def extract_business_rule_async(self, question: str, fallback: str = "") -> str:
+        return await self._stream_async(self._business_rule_messages(question), self._until_done) or fallback
+
+    def _business_rule_messages(self, question: str) -> List[Dict[str, str]]:
+        return [
             {"role": "system", "content": "Extract business rules relevant to the question."},
             {"role": "user", "content": question},
         ]
-        resp = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-        )
-        return resp.choices[0].message.content or fallback
 
     def generate_sql(self, query: str, business_rule: str = "", schema: str = "") -> str:
         self._ensure_available()
-        system = (
-            "You are a SQLite expert. Generate safe SELECT-only SQL. "
-            "Return only the SQL statement with no explanation. "
-            "Never include raw email, phone, or address unless needed for joins; prefer aggregated or masked data. "
-            "When a business rule is provided, you must encode every constraint from that rule into the SQL "
-            "(e.g., VIP definition thresholds, date windows, spend minimums). "
-            "Do not drop rule constraints even if the user query omits them. "
-            "Use only the tables and columns listed in the provided schema. "
-            "If the request cannot be satisfied with the available tables, return a empty string."
+        messages = self._generate_sql_messages(query, business_rule, schema)
+        # Paraphrases that differ only in literals ("orders over 100" / "over 500") embed almost
+        # identically but need different SQL, so generated SQL is only served on exact repeats.
+        return self._cached(
+            "generate_sql",
+            query,
+            self._sql_cache_context(business_rule, schema),
+            lambda: self._extract_sql(self._stream(messages, self._sql_complete)),
+            semantic=False,
+        )
+
+    async def generate_sql_async(self, query: str, business_rule: str = "", schema: str = "") -> str:
+        self._ensure_available()
+        messages = self._generate_sql_messages(query, business_rule, schema)
+
+        async def compute() -> str:
+            return self._extract_sql(await self._stream_async(messages, self._sql_complete))
+
+        return await self._cached_async(
+            "generate_sql",
+            query,
+            self._sql_cache_context(business_rule, schema),
+            compute,
+            semantic=False,
         )
+
+    def generate_sql_stream(self, query: str, business_rule: str = "", schema: str = "") -> Iterator[str]:
+        """
+        Yield raw SQL-generation text as it streams in, for callers that want to show
+        progress. Bypasses the response cache; join and pass through _extract_sql at the end.
+        Stops after the delta that closes the statement, trimmed at its terminating ';'.
+        """
+        self._ensure_available()
+        text = ""
+        with closing(self._iter_stream(self._generate_sql_messages(query, business_rule, schema))) as deltas:
+            for delta in deltas:
+                text += delta
+                if self._sql_complete(text):
+                    select = _SELECT_RE.search(text)
+                    yield delta[: len(delta) - (len(text) - sql_statement_end(text, select.start()))]
+                    return
+                yield delta
+
+    def _sql_cache_context(self, business_rule: str, schema: str) -> str:
+        schema_hash = hashlib.blake2b(schema.encode("utf-8")).hexdigest()
+        return business_rule + "\x1f" + schema_hash
+
+    def _generate_sql_messages(self, query: str, business_rule: str, schema: str) -> List[Dict[str, str]]:
+        trimmed_rule = truncate_relevant(business_rule, query, PROMPT_CONTEXT_MAX_CHARS)
+        trimmed_schema = truncate_relevant(schema, query, PROMPT_CONTEXT_MAX_CHARS)
+        if self.logger and (trimmed_rule is not business_rule or trimmed_schema is not schema):
+            self.logger.log(
+                "sql_prompt_truncation",
+                business_rule_chars=len(business_rule),
+                business_rule_kept=len(trimmed_rule),
+                schema_chars=len(schema),
+                schema_kept=len(trimmed_schema),
+            )
+        business_rule, schema = trimmed_rule, trimmed_schema
+        system = SQL_SYSTEM_PROMPT
         if schema:
             system += f"\nDatabase schema:\n{schema}"
-        messages = [
+        return [
             {"role": "system", "content": system},
             {
                 "role": "user",
                 "content": f"User query: {query}\nBusiness rule (must be enforced): {business_rule}",
             },
         ]
-        resp = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-        )
-        raw = resp.choices[0].message.content or ""
-        return self._extract_sql(raw)
 
     def correct_sql(self, original_sql: str, error_message: str, schema: str = "") -> str:
         self._ensure_available()
-        system = (
-            "You are helping fix a SQLite query. Return only corrected SQL. "
-            "Do not include explanations. "
-            "Use only the tables/columns in the provided schema; if the requested table does not exist, "
-            "return a safe placeholder like SELECT 'no matching table' AS message;"
+        messages = self._correct_sql_messages(original_sql, error_message, schema)
+        # SQL text is not paraphrase-tolerant, so corrections are only served on exact repeats.
+        return self._cached(
+            "correct_sql",
+            error_message,
+            original_sql + "\x1f" + schema,
+            lambda: self._complete(messages) or original_sql,
+            semantic=False,
         )
+
+    async def correct_sql_async(self, original_sql: str, error_message: str, schema: str = "") -> str:
+        self._ensure_available()
+        messages = self._correct_sql_messages(original_sql, error_message, schema)
+
+        async def compute() -> str:
+            return await self._complete_async(messages) or original_sql
+
+        return await self._cached_async(
+            "correct_sql",
+            error_message,
+            original_sql + "\x1f" + schema,
+            compute,
+            semantic=False,
+        )
+
+    def _correct_sql_messages(self, original_sql: str, error_message: str, schema: str) -> List[Dict[str, str]]:
+        system = CORRECT_SQL_SYSTEM_PROMPT
         if schema:
             system += f"\nDatabase schema:\n{schema}"
-        messages = [
+        return [
             {"role": "system", "content": system},
             {
                 "role": "user",
                 "content": f"Original SQL:\n{original_sql}\n\nError:\n{error_message}",
             },
         ]
-        resp = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-        )
-        return resp.choices[0].message.content or original_sql
 
-    def answer_from_docs(self, question: str, context: str) -> str:
-        """Answer using provided policy context only."""
+    def answer_from_docs(self, question: str, context: str, *, narrowed: bool = False) -> str:
+        """
+        Answer using provided policy context only. narrowed=True means the context was already
+        selected for this question, so an explicit "show me the X policy" may get it verbatim.
+        """
         if not context.strip():
             return "No relevant policy found."
+        if self._wants_verbatim_policy(question, context, narrowed):
+            return context
         self._ensure_available()
-        system = (
-            "You are a compliance/policy assistant. Answer the question strictly using the provided policy snippets. "
-            "If the policy does not contain the answer, say you do not have that information."
+        messages = self._answer_messages(question, context)
+        return self._cached(
+            "answer_from_docs",
+            question,
+            context,
+            lambda: self._stream(messages, self._answer_budget_reached) or context,
         )
-        messages = [
-            {"role": "system", "content": system},
+
+    async def answer_from_docs_async(self, question: str, context: str, *, narrowed: bool = False) -> str:
+        if not context.strip():
+            return "No relevant policy found."
+        if self._wants_verbatim_policy(question, context, narrowed):
+            return context
+        self._ensure_available()
+        messages = self._answer_messages(question, context)
+
+        async def compute() -> str:
+            return await self._stream_async(messages, self._answer_budget_reached) or context
+
+        return await self._cached_async("answer_from_docs", question, context, compute)
+
+    def _wants_verbatim_policy(self, question: str, context: str, narrowed: bool) -> bool:
+        """
+        The user asked to see the policy itself, and the context was narrowed to it and fits in
+        an answer as-is. An unfiltered document (e.g. a small one select_policy_context passed
+        through whole) would also expose unrelated rules, so the LLM answers from it instead.
+        """
+        if not narrowed or len(context) > ANSWER_MAX_CHARS or not _VERBATIM_POLICY_RE.match(question):
+            return False
+        if self.logger:
+            self.logger.log("answer_from_docs_verbatim", question=question, context_chars=len(context))
+        return True
+
+    def _answer_messages(self, question: str, context: str) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": DOCS_SYSTEM_PROMPT},
             {"role": "user", "content": f"Policy snippets:\n{context}\n\nQuestion: {question}"},
         ]
-        resp = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-        )
-        return resp.choices[0].message.content or context
 
     def select_policy_context(self, question: str, policy_text: str, fallback: str = "") -> str:
         """
@@ -243,83 +969,78 @@ class LLMClient:
         """
         if not policy_text.strip():
             return ""
+        if len(policy_text) < SMALL_POLICY_CHARS:
+            return policy_text  # filtering would save fewer tokens than the round trip costs
         self._ensure_available()
-        messages = [
-            {
-                "role": "system",
-                "content": (
-                    "You are a retrieval filter. Given a policy document and a user question, "
-                    "return relevant sentences/paragraphs from document regarding the question. "
-                    "Do not invent content. If nothing is relevant, return an empty string."
-                ),
-            },
-            {
-                "role": "user",
-                "content": f"Question: {question}\n\nPolicy document:\n{policy_text}",
-            },
-        ]
-        resp = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
+        selected = self._stream(self._policy_selection_messages(question, policy_text), self._until_done)
+        return selected or fallback or policy_text
+
+    async def select_policy_context_async(self, question: str, policy_text: str, fallback: str = "") -> str:
+        if not policy_text.strip():
+            return ""
+        if len(policy_text) < SMALL_POLICY_CHARS:
+            return policy_text
+        selected = await self._stream_async(
+            self._policy_selection_messages(question, policy_text),
+            self._until_done,
         )
-        return resp.choices[0].message.content or fallback or policy_text
+        return selected or fallback or policy_text
+
+    def _policy_selection_messages(self, question: str, policy_text: str) -> List[Dict[str, str]]:
+        # The policy document goes in the system message so the prompt prefix stays identical
+        # across questions and can be served from the provider's prompt cache.
+        return [
+            {"role": "system", "content": f"{POLICY_FILTER_SYSTEM_PROMPT}\n\nPolicy document:\n{policy_text}"},
+            {"role": "user", "content": f"Question: {question}"},
+        ]
 
     def _extract_sql(self, text: str) -> str:
         """Strip markdown/prose and keep the SQL statement."""
-        import re
+        return extract_sql(text)
 
-        fenced = re.search(r"```(?:sql)?\s*(.*?)```", text, flags=re.IGNORECASE | re.DOTALL)
-        if fenced:
-            text = fenced.group(1)
+    def _policy_keyword_hit(self, query: str) -> bool:
+        return _POLICY_RE.search(query) is not None
 
-        text = text.strip()
-        match = re.search(r"select\b", text, flags=re.IGNORECASE)
-        if match:
-            return text[match.start():].strip()
-        return text
+    def _classify_via_llm(self, query: str, policy_text: str = "") -> Classification:
+        resp = self._chat(self._classify_messages(query, policy_text))
+        return self._parse_classification(resp)
 
-    def _policy_keyword_hit(self, query: str) -> bool:
-        return any(term in query.lower() for term in self.policy_terms)
+    async def _classify_via_llm_async(self, query: str, policy_text: str = "") -> Classification:
+        resp = await self._chat_async(self._classify_messages(query, policy_text))
+        return self._parse_classification(resp)
 
-    def _classify_via_llm(self, query: str) -> Classification:
-        tools_spec = [
-            {
-                "type": "function",
-                "function": {
-                    "name": "classify_query",
-                    "parameters": CLASSIFY_SCHEMA,
-                },
-            }
-        ]
-        messages = [
-            {"role": "system", "content": SYSTEM_ROUTER_PROMPT},
+    def _classify_messages(self, query: str, policy_text: str = "") -> List[Dict[str, str]]:
+        system = SYSTEM_ROUTER_PROMPT
+        if policy_text.strip():
+            system += f"\n\nPolicy document:\n{policy_text}"
+        return [
+            {"role": "system", "content": system},
             {"role": "user", "content": query},
         ]
 
+    def _parse_classification(self, resp: Dict[str, Any]) -> Classification:
         requires_sql = True
         requires_policy = False
-        explanation = ""
         unknown = False
+        policy_snippet = ""
 
-        resp = self._chat(messages, tools=tools_spec)
-        tool_calls = resp["choices"][0]["message"].get("tool_calls", [])
-        if tool_calls:
-            args = tool_calls[0]["function"].get("arguments", "{}")
+        content = resp["choices"][0]["message"].get("content")
+        if content:
             try:
-                payload = json.loads(args)
+                payload = json.loads(content)
                 requires_sql = bool(payload.get("requires_sql", True))
                 requires_policy = bool(payload.get("requires_policy", False))
-                explanation = payload.get("explanation", "")
                 unknown = bool(payload.get("unknown", False))
-            except (json.JSONDecodeError, TypeError, ValueError):
+                policy_snippet = str(payload.get("relevant_policy_snippet") or "")
+            except (json.JSONDecodeError, AttributeError, TypeError, ValueError):
                 unknown = False
 
         return Classification(
             requires_sql=requires_sql,
             requires_policy=requires_policy,
-            explanation=explanation,
             source="llm",
             unknown=unknown,
+            policy_snippet=policy_snippet,
         )
 
     def _log_classification(self, query: str, classification: Classification) -> Dict[str, Any]:
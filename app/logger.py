@@ -1,20 +1,127 @@
+import atexit
 import json
 import logging
-from datetime import datetime
+import queue
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
+
+
+# Buffered writes are flushed every FLUSH_EVERY lines, when the queue drains, on close() and at exit.
+FLUSH_EVERY = 32
+
+# One append handle per log file, shared by every TraceLogger writing to it.
+_HANDLES: Dict[Path, IO[str]] = {}
+_HANDLES_LOCK = threading.Lock()
+
+_ts_second = -1
+_ts_prefix = ""
+
+
+def _timestamp() -> str:
+    """UTC ISO-8601 timestamp; the strftime prefix is reused within the same second."""
+    global _ts_second, _ts_prefix
+    now = time.time()
+    second = int(now)
+    if second != _ts_second:
+        _ts_prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+        _ts_second = second
+    return f"{_ts_prefix}.{int((now - second) * 1_000_000):06d}Z"
+
+
+def _handle_for(path: Path) -> IO[str]:
+    key = path.resolve()
+    with _HANDLES_LOCK:
+        handle = _HANDLES.get(key)
+        if handle is None or handle.closed:
+            handle = _HANDLES[key] = key.open("a", encoding="utf-8", buffering=8192)
+        return handle
+
+
+def _dumps(event: Dict[str, Any]) -> str:
+    if orjson is not None:
+        return orjson.dumps(event).decode("utf-8")
+    return json.dumps(event)
+
+
+# Serialization and I/O run on one background thread; log() only enqueues.
+_QUEUE: "queue.Queue[Tuple[Optional[IO[str]], List[Dict[str, Any]]]]" = queue.Queue()
+_drain_thread: Optional[threading.Thread] = None
+_drain_lock = threading.Lock()
+
+
+def _drain() -> None:
+    text_logger = logging.getLogger("agent")
+    unflushed: Dict[IO[str], int] = {}
+    while True:
+        handle, events = _QUEUE.get()
+        try:
+            lines = [_dumps(event) for event in events]
+            for line in lines:
+                text_logger.info(line)
+            if handle is not None and not handle.closed:
+                handle.write("\n".join(lines) + "\n")
+                unflushed[handle] = unflushed.get(handle, 0) + len(lines)
+            if _QUEUE.empty() or any(count >= FLUSH_EVERY for count in unflushed.values()):
+                for pending in unflushed:
+                    if not pending.closed:
+                        pending.flush()
+                unflushed.clear()
+        except Exception:  # never let a bad event kill the writer thread
+            logging.getLogger(__name__).exception("trace log write failed")
+        finally:
+            _QUEUE.task_done()
+
+
+def _ensure_drain_thread() -> None:
+    global _drain_thread
+    with _drain_lock:
+        if _drain_thread is None or not _drain_thread.is_alive():
+            _drain_thread = threading.Thread(target=_drain, name="trace-logger", daemon=True)
+            _drain_thread.start()
+
+
+@atexit.register
+def _close_handles() -> None:
+    if _drain_thread is not None and _drain_thread.is_alive():
+        _QUEUE.join()
+    with _HANDLES_LOCK:
+        for handle in _HANDLES.values():
+            handle.close()
+        _HANDLES.clear()
+
+
+# Request-scoped state, so one logger can be shared by concurrent requests.
+_CAPTURED: ContextVar[Optional[List[Dict[str, Any]]]] = ContextVar("trace_captured", default=None)
+_BATCH: ContextVar[Optional[Tuple["TraceLogger", List[Dict[str, Any]]]]] = ContextVar("trace_batch", default=None)
 
 
 class TraceLogger:
     """Structured logger that emits JSON lines for each agent step."""
 
+    # Process-wide counters, shared by every logger instance.
+    _counters: Counter = Counter()
+    _counter_lock = threading.Lock()
+
     def __init__(self, log_path: Optional[str] = None, record_events: bool = False) -> None:
         self.log_path = Path(log_path) if log_path else None
         self.record_events = record_events
         self._events: List[Dict[str, Any]] = []
+        self._fh: Optional[IO[str]] = None
         self._setup_text_logger()
         if self.log_path:
             self.log_path.parent.mkdir(parents=True, exist_ok=True)
+            self._fh = _handle_for(self.log_path)
+        _ensure_drain_thread()
 
     def _setup_text_logger(self) -> None:
         logging.basicConfig(
@@ -25,17 +132,61 @@ class TraceLogger:
 
     def log(self, step: str, **payload: Any) -> None:
         event: Dict[str, Any] = {
-            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "timestamp": _timestamp(),
             "step": step,
         }
         event.update(payload)
-        line = json.dumps(event)
-        self.text_logger.info(line)
         if self.record_events:
             self._events.append(event)
-        if self.log_path:
-            with self.log_path.open("a", encoding="utf-8") as handle:
-                handle.write(line + "\n")
+        captured = _CAPTURED.get()
+        if captured is not None:
+            captured.append(event)
+        batch = _BATCH.get()
+        if batch is not None and batch[0] is self:
+            batch[1].append(event)
+        else:
+            _QUEUE.put_nowait((self._fh, [event]))
+
+    @contextmanager
+    def capture(self) -> Iterator[List[Dict[str, Any]]]:
+        """Collect the events logged in the current context (e.g. one request) into a list."""
+        events: List[Dict[str, Any]] = []
+        token = _CAPTURED.set(events)
+        try:
+            yield events
+        finally:
+            _CAPTURED.reset(token)
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """Hold this context's events inside the block and hand them to the writer as a single write."""
+        if _BATCH.get() is not None:
+            yield  # already batching in this context
+            return
+        pending: List[Dict[str, Any]] = []
+        token = _BATCH.set((self, pending))
+        try:
+            yield
+        finally:
+            _BATCH.reset(token)
+            if pending:
+                _QUEUE.put_nowait((self._fh, pending))
+
+    def flush(self) -> None:
+        """Block until every queued event has been written, then flush the file."""
+        _QUEUE.join()
+        if self._fh and not self._fh.closed:
+            self._fh.flush()
+
+    def close(self) -> None:
+        """Flush queued events; the shared handle itself is closed at interpreter exit."""
+        self.flush()
+
+    def incr(self, name: str, amount: int = 1) -> int:
+        """Increment a process-wide counter and return its new value."""
+        with self._counter_lock:
+            self._counters[name] += amount
+            return self._counters[name]
 
     def events(self) -> List[Dict[str, Any]]:
         return list(self._events)
@@ -1,7 +1,20 @@
 import re
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterable, List
 
-PII_FIELDS = {"email", "phone", "address"}
+PII_FIELDS = frozenset({"email", "phone", "address"})
+
+# Query-time detection: the PII column names plus the generic "pii" term. Matched anywhere,
+# so compounds such as "telephone" or "cellphone" are blocked too.
+PII_TERMS = ("email", "phone", "address", "pii")
+PII_RE = re.compile(r"(?:email|phone|address|pii)", re.IGNORECASE)
+
+_NONDIGIT_RE = re.compile(r"\D")
+
+
+def detect(query: str) -> List[str]:
+    """Return the PII terms mentioned anywhere in a query, in PII_TERMS order."""
+    found = {match.group(0).lower() for match in PII_RE.finditer(query)}
+    return [term for term in PII_TERMS if term in found]
 
 
 def mask_email(value: str) -> str:
@@ -14,7 +27,7 @@ def mask_email(value: str) -> str:
 
 
 def mask_phone(value: str) -> str:
-    digits = re.sub(r"\\D", "", value)
+    digits = _NONDIGIT_RE.sub("", value)
     if len(digits) < 4:
         return "***"
     return f"***-***-{digits[-4:]}"
@@ -34,11 +47,33 @@ MASKERS = {
 def mask_record(record: Dict[str, Any]) -> Dict[str, Any]:
     """Mask known PII fields in a row dict."""
     masked = dict(record)
-    for field, masker in MASKERS.items():
-        if field in masked and masked[field] is not None:
-            masked[field] = masker(str(masked[field]))
+    for field in PII_FIELDS.intersection(record):
+        if masked[field] is not None:
+            masked[field] = MASKERS[field](str(masked[field]))
     return masked
 
 
+def mask_rows(rows: Iterable[Dict[str, Any]], columns: List[str]) -> List[Dict[str, Any]]:
+    """Mask PII fields across a result set, resolving the maskers once from its columns."""
+    cols_lower = [col.lower() for col in columns]
+    maskers = [(col, MASKERS[lower]) for col, lower in zip(columns, cols_lower) if lower in MASKERS]
+    if not maskers:
+        return list(rows)
+    masked_rows = []
+    for row in rows:
+        masked = dict(row)
+        for col, masker in maskers:
+            value = masked.get(col)
+            if value is not None:
+                masked[col] = masker(str(value))
+        masked_rows.append(masked)
+    return masked_rows
+
+
+def pii_columns(columns: List[str]) -> List[str]:
+    """Return the result columns that carry PII."""
+    return [col for col in columns if col.lower() in PII_FIELDS]
+
+
 def contains_pii_fields(columns: List[str]) -> bool:
-    return any(col.lower() in PII_FIELDS for col in columns)
+    return not PII_FIELDS.isdisjoint(col.lower() for col in columns)
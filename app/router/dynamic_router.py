@@ -1,6 +1,7 @@
 from __future__ import annotations
 
-from typing import Dict
+import asyncio
+from typing import Any, Dict, List, Optional
 
 from app.llm import LLMClient
 from app.logger import TraceLogger
@@ -11,23 +12,62 @@ from app.router.pre_router import PreRouter
 
 
 class Router:
-    """Multi-layer routing: preprocess → policy keyword → embedding hint → LLM classifier."""
+    """Multi-layer routing: preprocess → cache/fast path → policy keyword + embedding hint → LLM classifier."""
 
     def __init__(self, llm: LLMClient, logger: TraceLogger) -> None:
         self.llm = llm
         self.logger = logger
         self.pre_router = PreRouter(logger)
-        self.embedding_router = EmbeddingRouter(logger)
+        self.embedding_router = EmbeddingRouter(llm, logger)
         self.policy_router = PolicyRouter(llm.policy_terms, logger)
         self.llm_router = LLMRouter(llm, logger)
 
-    def route(self, query: str) -> Dict[str, str | bool | None]:
+    def route(self, query: str, policy_text: str = "") -> Dict[str, str | bool | None]:
+        """Synchronous shim for callers outside an event loop."""
+        return asyncio.run(self.route_async(query, policy_text))
+
+    async def route_async(self, query: str, policy_text: str = "") -> Dict[str, str | bool | None]:
         normalized = self.pre_router.normalize(query)
 
-        policy_hit = self.policy_router.detect(normalized)
-        embedding_hint = self.embedding_router.suggest(normalized)
-        llm_tools = self.llm_router.classify(normalized)
+        # Cheapest first: cached/fast-path classification needs no network at all.
+        llm_tools = self.llm_router.classify_local(normalized, policy_text)
+        if llm_tools is not None:
+            policy_hit = self.policy_router.detect(normalized)
+            return self._merge(normalized, policy_hit, None, llm_tools)
+
+        # Then an embedding lookup against previously routed queries; a hit makes no LLM call.
+        policy_hit, embedding_hint = await asyncio.gather(
+            asyncio.to_thread(self.policy_router.detect, normalized),
+            self.embedding_router.suggest_async(normalized),
+        )
+        try:
+            if embedding_hint:
+                llm_tools = {"source": "embedding_router"}
+            else:
+                llm_tools = await self.llm_router.classify_remote_async(normalized, policy_text)
+            payload = self._merge(normalized, policy_hit, embedding_hint, llm_tools)
+        except BaseException:
+            self.embedding_router.forget(normalized)
+            raise
+        self.embedding_router.remember(normalized, str(payload["decision"]))
+        return payload
+
+    def route_batch(self, queries: List[str], policy_text: str = "") -> List[Dict[str, str | bool | None]]:
+        """Route many queries through the LLM Batch API, merged with the policy keyword layer."""
+        normalized = [self.pre_router.normalize(query) for query in queries]
+        classifications = self.llm.classify_tools_batch(normalized, policy_text=policy_text)
+        return [
+            self._merge(query, self.policy_router.detect(query), None, classification.to_dict())
+            for query, classification in zip(normalized, classifications)
+        ]
 
+    def _merge(
+        self,
+        normalized: str,
+        policy_hit: bool,
+        embedding_hint: Optional[Dict[str, str | bool | float]],
+        llm_tools: Dict[str, Any],
+    ) -> Dict[str, str | bool | None]:
         requires_policy = policy_hit or bool(llm_tools.get("requires_policy", False))
         requires_sql = bool(llm_tools.get("requires_sql", False))
         unknown = bool(llm_tools.get("unknown", False))
@@ -51,7 +91,7 @@ class Router:
             "unknown": unknown,
             "decision": decision,
             "source": str(llm_tools.get("source", "router")),
-            "explanation": str(llm_tools.get("explanation", "")),
+            "policy_snippet": str(llm_tools.get("policy_snippet", "")),
             "policy_keyword_hit": policy_hit,
             "embedding_decision": embedding_hint.get("decision") if embedding_hint else None,
         }
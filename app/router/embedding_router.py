@@ -1,24 +1,128 @@
 from __future__ import annotations
 
-from typing import Dict, Optional
+import threading
+from typing import Any, Dict, List, Optional
 
+from app.llm import LLMClient
 from app.logger import TraceLogger
 
+try:
+    import numpy as np
+except ImportError:  # embeddings routing is skipped without numpy
+    np = None  # type: ignore
+
+EMBEDDING_ROUTER_THRESHOLD = 0.92
+EMBEDDING_ROUTER_MAX_ENTRIES = 10_000
+
+
+class _DecisionIndex:
+    """Process-wide store of (unit query embedding, routing decision) pairs."""
+
+    def __init__(self, max_entries: int = EMBEDDING_ROUTER_MAX_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self._vectors: List[Any] = []
+        self._decisions: List[str] = []
+        self._matrix: Any = None
+        self._lock = threading.Lock()
+
+    def nearest(self, vector: Any) -> Optional[tuple[str, float]]:
+        with self._lock:
+            if not self._vectors:
+                return None
+            if self._matrix is None:
+                self._matrix = np.stack(self._vectors)
+            matrix, decisions = self._matrix, self._decisions
+        scores = np.einsum("ij,j->i", matrix, vector)
+        best = int(scores.argmax())
+        return decisions[best], float(scores[best])
+
+    def add(self, vector: Any, decision: str) -> None:
+        with self._lock:
+            if len(self._vectors) >= self.max_entries:
+                # Oldest entries go first; the list stays small enough for a brute-force scan.
+                del self._vectors[0], self._decisions[0]
+            self._vectors.append(vector)
+            self._decisions.append(decision)
+            self._matrix = None
+
+
+_DECISIONS = _DecisionIndex()
+
 
 class EmbeddingRouter:
     """
-    Placeholder embedding-based router.
-    Returns None until an embedding model/store is wired in.
+    Embedding-based router.
+    Suggests the decision of the most similar previously classified query, so near-duplicate
+    questions ("list vip customers" / "show vip customers") skip the LLM classifier.
     """
 
-    def __init__(self, logger: TraceLogger | None = None) -> None:
+    def __init__(
+        self,
+        llm: LLMClient | None = None,
+        logger: TraceLogger | None = None,
+        threshold: float = EMBEDDING_ROUTER_THRESHOLD,
+    ) -> None:
+        self.llm = llm
         self.logger = logger
+        self.threshold = threshold
+        self._embeddings: Dict[str, Any] = {}
 
-    def suggest(self, query: str) -> Optional[Dict[str, str | bool]]:
+    def suggest(self, query: str) -> Optional[Dict[str, str | bool | float]]:
         """
         Optionally return a suggestion like {"decision": "docs", "reason": "..."}.
-        Currently returns None to keep routing LLM-driven until embeddings are added.
+        Returns None when embeddings are unavailable or no cached query is similar enough.
         """
+        if self.llm is None or np is None:
+            return self._log(None)
+        return self._suggest(query, self.llm.embed(query))
+
+    async def suggest_async(self, query: str) -> Optional[Dict[str, str | bool | float]]:
+        if self.llm is None or np is None:
+            return self._log(None)
+        return self._suggest(query, await self.llm.embed_async(query))
+
+    def remember(self, query: str, decision: str) -> None:
+        """Record the final decision for a query embedded by a previous suggest call."""
+        vector = self._embeddings.pop(query, None)
+        if vector is not None and decision != "unknown":
+            _DECISIONS.add(vector, decision)
+
+    def forget(self, query: str) -> None:
+        """Drop the pending embedding for a query whose routing failed before remember()."""
+        self._embeddings.pop(query, None)
+
+    def _suggest(self, query: str, embedding: Optional[List[float]]) -> Optional[Dict[str, str | bool | float]]:
+        if embedding is None:
+            return self._log(None)
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        if not norm:
+            return self._log(None)
+        vector /= norm
+        nearest = _DECISIONS.nearest(vector)
+        if nearest is None or nearest[1] < self.threshold:
+            self._embeddings[query] = vector
+            return self._log(None, nearest[1] if nearest else None)
+        decision, similarity = nearest
+        return self._log(
+            {
+                "decision": decision,
+                "reason": "similar to a previously routed query",
+                "similarity": round(similarity, 4),
+            },
+            similarity,
+        )
+
+    def _log(
+        self,
+        hint: Optional[Dict[str, str | bool | float]],
+        similarity: Optional[float] = None,
+    ) -> Optional[Dict[str, str | bool | float]]:
         if self.logger:
-            self.logger.log("embedding_router_result", used=False, decision=None)
-        return None
+            self.logger.log(
+                "embedding_router_result",
+                used=hint is not None,
+                decision=hint["decision"] if hint else None,
+                similarity=round(similarity, 4) if similarity is not None else None,
+            )
+        return hint
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 from app.llm import LLMClient
 from app.logger import TraceLogger
@@ -11,8 +11,27 @@ class LLMRouter:
         self.llm = llm
         self.logger = logger
 
-    def classify(self, query: str) -> Dict[str, Any]:
-        tools = self.llm.classify_tools(query, skip_policy_rule=True)
+    def classify(self, query: str, policy_text: str = "") -> Dict[str, Any]:
+        tools = self.llm.classify_tools(query, policy_text=policy_text)
+        if self.logger:
+            self.logger.log("llm_router_result", **tools)
+        return tools
+
+    async def classify_async(self, query: str, policy_text: str = "") -> Dict[str, Any]:
+        tools = await self.llm.classify_tools_async(query, policy_text=policy_text)
+        if self.logger:
+            self.logger.log("llm_router_result", **tools)
+        return tools
+
+    def classify_local(self, query: str, policy_text: str = "") -> Optional[Dict[str, Any]]:
+        """Cache/fast-path classification only; None means an LLM round trip is needed."""
+        tools = self.llm.classify_local(query, policy_text=policy_text)
+        if tools is not None and self.logger:
+            self.logger.log("llm_router_result", **tools)
+        return tools
+
+    async def classify_remote_async(self, query: str, policy_text: str = "") -> Dict[str, Any]:
+        tools = await self.llm.classify_remote_async(query, policy_text=policy_text)
         if self.logger:
             self.logger.log("llm_router_result", **tools)
         return tools
@@ -1,16 +1,18 @@
 from __future__ import annotations
 
 from app.logger import TraceLogger
+from app.utils import policy_term_pattern
 
 
 class PolicyRouter:
     def __init__(self, policy_terms: list[str], logger: TraceLogger | None = None) -> None:
         self.policy_terms = [term.lower() for term in policy_terms]
         self.logger = logger
+        # Same compiled pattern as LLMClient's keyword check, so both layers agree on a hit.
+        self._policy_re = policy_term_pattern(tuple(self.policy_terms))
 
     def detect(self, query: str) -> bool:
-        lowered = query.lower()
-        hit = any(term in lowered for term in self.policy_terms)
+        hit = self._policy_re.search(query) is not None
         if self.logger:
             self.logger.log("policy_router_result", policy_keyword_hit=hit)
         return hit
@@ -1,11 +1,75 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import itertools
+import json
+import os
 import sqlite3
-from typing import Any, Dict, List, Tuple
+import threading
+from operator import itemgetter
+from pathlib import Path
+from typing import Any, ClassVar, Dict, Generator, List, Tuple
 
 from app.llm import LLMClient
 from app.logger import TraceLogger
-from app.pii import PII_FIELDS
+from app.pii import pii_columns
+from app.utils import extract_sql
+
+
+# Schema summaries persist here (next to the database), keyed by db path and schema stamp.
+SCHEMA_CACHE_FILE = ".schema_cache.json"
+
+# Rows are pulled from SQLite in batches of this size.
+FETCH_BATCH_SIZE = 256
+
+SCHEMA_QUERY = """
+SELECT m.name, p.name, p.type
+FROM sqlite_master m JOIN pragma_table_info(m.name) p
+WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite_%'
+"""
+
+# Every DDL statement in the file; hashing it tells two databases with equal schema_version apart.
+SCHEMA_DDL_QUERY = "SELECT group_concat(coalesce(sql, ''), ';') FROM (SELECT sql FROM sqlite_master ORDER BY type, name)"
+
+
+def open_connection(db_path: str) -> sqlite3.Connection:
+    """
+    Open a long-lived, thread-shareable, read-only connection with the agent's PRAGMAs applied.
+    Every caller only reads (the executor's guardrail rejects anything but SELECT), so the
+    file is opened with mode=ro, and query_only backs that up at the SQL level.
+    """
+    uri = f"{Path(db_path).resolve().as_uri()}?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False, isolation_level=None, cached_statements=256)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA query_only=1")
+    conn.execute("PRAGMA mmap_size=268435456")
+    conn.execute("PRAGMA cache_size=-64000")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    """SQLite bumps this counter on every DDL change, so it cheaply gates schema caches."""
+    return conn.execute("PRAGMA schema_version").fetchone()[0]
+
+
+def schema_stamp(conn: sqlite3.Connection) -> str:
+    """
+    schema_version plus a digest of the sqlite_master DDL. The version alone is only a
+    per-file counter, so a different database swapped in at the same path can share it.
+    """
+    ddl = conn.execute(SCHEMA_DDL_QUERY).fetchone()[0] or ""
+    return f"{schema_version(conn)}:{hashlib.sha1(ddl.encode('utf-8')).hexdigest()}"
+
+
+def read_schema(conn: sqlite3.Connection) -> List[Tuple[str, List[Tuple[str, str]]]]:
+    """Return [(table, [(column, type), ...]), ...] for every user table in one query."""
+    rows = conn.execute(SCHEMA_QUERY).fetchall()
+    return [
+        (table, [(col, col_type) for _, col, col_type in cols])
+        for table, cols in itertools.groupby(rows, key=itemgetter(0))
+    ]
 
 
 class PIIBlockError(Exception):
@@ -15,36 +79,102 @@ class PIIBlockError(Exception):
 
 
 class SQLExecutor:
+    # Shared by every executor in the process: {abs db path: (schema stamp, summary)}.
+    _schema_cache: ClassVar[Dict[str, Tuple[str, str]]] = {}
+    _schema_cache_lock: ClassVar[threading.Lock] = threading.Lock()
+
     def __init__(self, db_path: str, llm: LLMClient, logger: TraceLogger) -> None:
         self.db_path = db_path
         self.llm = llm
         self.logger = logger
-        self._schema_cache: str | None = None
+        # One connection for the executor's lifetime; the lock serialises access across threads.
+        self._lock = threading.Lock()
+        self._conn = open_connection(self.db_path)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __del__(self) -> None:
+        conn = getattr(self, "_conn", None)
+        if conn is not None:
+            conn.close()
 
     def _is_safe(self, sql: str) -> bool:
-        lowered = sql.lower().strip()
-        is_select = lowered.startswith("select")
+        # Lowercase only the 6-char prefix, not the whole (possibly long) LLM output.
+        is_select = sql.lstrip()[:6].lower() == "select"
         if self.logger:
             self.logger.log("sql_guardrail_check_result", sql_preview=sql[:200], allowed=is_select)
         return is_select
 
     def _run_sql(self, sql: str) -> Tuple[List[str], List[Dict[str, Any]]]:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        try:
-            cursor = conn.execute(sql)
-            rows = cursor.fetchall()
+        """Run a query and return its columns and PII-checked row dicts."""
+        with self._lock:
+            cursor = self._conn.cursor()
+            cursor.row_factory = None  # raw tuples; each row becomes a dict exactly once
+            cursor.arraysize = FETCH_BATCH_SIZE
+            cursor.execute(sql)
             columns = [desc[0] for desc in cursor.description]
-            data = [dict(row) for row in rows]
-            return columns, data
-        finally:
-            conn.close()
+            # The guardrail runs on the column list before any rows are fetched.
+            return columns, self._mask_rows(columns, cursor)
 
     def execute_with_retry(self, sql: str, max_attempts: int = 3, schema: str = "") -> Dict[str, Any]:
         """Execute a SELECT with safety checks, retries, and PII masking."""
+        steps = self._retry_steps(sql, max_attempts, schema)
+        try:
+            step = next(steps)
+            while True:
+                try:
+                    reply = self._run_step(step)
+                except Exception as exc:
+                    step = steps.throw(exc)
+                else:
+                    step = steps.send(reply)
+        except StopIteration as done:
+            return done.value
+
+    async def execute_with_retry_async(self, sql: str, max_attempts: int = 3, schema: str = "") -> Dict[str, Any]:
+        """Async execute_with_retry: SQLite work runs on a worker thread, corrections are awaited."""
+        steps = self._retry_steps(sql, max_attempts, schema)
+        try:
+            step = next(steps)
+            while True:
+                try:
+                    reply = await self._run_step_async(step)
+                except Exception as exc:
+                    step = steps.throw(exc)
+                else:
+                    step = steps.send(reply)
+        except StopIteration as done:
+            return done.value
+
+    def _run_step(self, step: Tuple[Any, ...]) -> Any:
+        kind, *args = step
+        if kind == "schema":
+            return self.schema_summary()
+        if kind == "run":
+            return self._run_sql(*args)
+        return self.llm.correct_sql(*args)
+
+    async def _run_step_async(self, step: Tuple[Any, ...]) -> Any:
+        kind, *args = step
+        if kind == "schema":
+            return await asyncio.to_thread(self.schema_summary)
+        if kind == "run":
+            return await asyncio.to_thread(self._run_sql, *args)
+        return await self.llm.correct_sql_async(*args)
+
+    def _retry_steps(
+        self, sql: str, max_attempts: int, schema: str
+    ) -> Generator[Tuple[Any, ...], Any, Dict[str, Any]]:
+        """
+        The retry loop shared by the sync and async drivers. It yields the blocking steps
+        ("schema",), ("run", sql) and ("correct", sql, error, schema) and receives their
+        results; a step's exception is thrown back in at the yield.
+        """
         original_sql = sql
         attempts: List[Dict[str, Any]] = []
-        schema_text = schema or self.schema_summary()
+        schema_text = schema or (yield ("schema",))
         for attempt in range(1, max_attempts + 1):
             sql = self._extract_sql(sql)
             if not self._is_safe(sql):
@@ -52,8 +182,7 @@ class SQLExecutor:
                 self.logger.log("sql_execute", attempt=attempt, status="blocked", message=msg)
                 return {"error": msg, "attempts": attempts}
             try:
-                columns, data = self._run_sql(sql)
-                masked_data = self._mask_rows(columns, data)
+                columns, masked_data = yield ("run", sql)
                 if not masked_data:
                     attempts.append({"attempt": attempt, "error": "Empty result set"})
                     self.logger.log("sql_execute", attempt=attempt, status="empty", rows=0)
@@ -64,10 +193,11 @@ class SQLExecutor:
                             "attempts": attempts,
                             "warning": "Empty result set",
                         }
-                    sql = self.llm.correct_sql(
+                    sql = yield (
+                        "correct",
                         sql,
                         "Query returned zero rows; please regenerate the SQL based on the schema and policy context to return correct results.",
-                        schema=schema_text,
+                        schema_text,
                     )
                     self.logger.log(
                         "sql_retry_empty",
@@ -102,7 +232,7 @@ class SQLExecutor:
                     }
                 if attempt == max_attempts:
                     break
-                sql = self.llm.correct_sql(sql, err_msg, schema=schema_text)
+                sql = yield ("correct", sql, err_msg, schema_text)
                 self.logger.log(
                     "sql_retry",
                     attempt=attempt + 1,
@@ -113,53 +243,86 @@ class SQLExecutor:
         return {"error": f"Failed after {max_attempts} attempts", "attempts": attempts, "sql": original_sql}
 
     def schema_summary(self) -> str:
-        """Return cached schema description for prompting."""
-        if self._schema_cache is not None:
-            return self._schema_cache
-        conn = sqlite3.connect(self.db_path)
+        """Return the schema description for prompting, rebuilt only when the schema stamp moves."""
+        key = os.path.abspath(self.db_path)
+        with self._lock:
+            stamp = schema_stamp(self._conn)
+        with self._schema_cache_lock:
+            cached = self._schema_cache.get(key) or self._read_schema_file(key)
+            if cached is not None and cached[0] == stamp:
+                self._schema_cache[key] = cached
+                return cached[1]
+        return self._rebuild_schema(key, stamp)
+
+    def refresh_schema(self) -> str:
+        """Rebuild the cached schema description regardless of the schema stamp."""
+        key = os.path.abspath(self.db_path)
+        with self._lock:
+            stamp = schema_stamp(self._conn)
+        return self._rebuild_schema(key, stamp)
+
+    def _rebuild_schema(self, key: str, stamp: str) -> str:
+        with self._lock:
+            schema = read_schema(self._conn)
+        summary = "\n".join(
+            f"Table {table} ({', '.join(f'{col} {col_type}' for col, col_type in cols)})"
+            for table, cols in schema
+        )
+        with self._schema_cache_lock:
+            self._schema_cache[key] = (stamp, summary)
+            self._write_schema_file(key)
+        return summary
+
+    @staticmethod
+    def _schema_file(key: str) -> str:
+        return os.path.join(os.path.dirname(key), SCHEMA_CACHE_FILE)
+
+    @classmethod
+    def _read_schema_file(cls, key: str) -> Tuple[str, str] | None:
         try:
-            cursor = conn.execute(
-                "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"
-            )
-            tables = [row[0] for row in cursor.fetchall()]
-            summaries: List[str] = []
-            for table in tables:
-                cols_cursor = conn.execute(f"PRAGMA table_info('{table}')")
-                cols = [f"{c[1]} {c[2]}" for c in cols_cursor.fetchall()]
-                summaries.append(f"Table {table} ({', '.join(cols)})")
-            self._schema_cache = "\n".join(summaries)
-            return self._schema_cache
-        finally:
-            conn.close()
+            with open(cls._schema_file(key), encoding="utf-8") as handle:
+                entry = json.load(handle).get(key)
+            return str(entry["schema_stamp"]), str(entry["summary"])
+        except (OSError, ValueError, AttributeError, KeyError, TypeError):
+            return None
+
+    @classmethod
+    def _write_schema_file(cls, key: str) -> None:
+        """Atomically rewrite the cache file with every entry for databases in the same directory."""
+        path = cls._schema_file(key)
+        directory = os.path.dirname(key)
+        payload = {
+            db: {"schema_stamp": stamp, "summary": summary}
+            for db, (stamp, summary) in cls._schema_cache.items()
+            if os.path.dirname(db) == directory
+        }
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as handle:
+                json.dump(payload, handle)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass  # read-only location; the in-process cache still applies
 
     def _extract_sql(self, sql: str) -> str:
         """Strip markdown/prose and return the SQL statement."""
-        import re
-
-        # Pull from fenced code block first.
-        fenced = re.search(r"```(?:sql)?\s*(.*?)```", sql, flags=re.IGNORECASE | re.DOTALL)
-        if fenced:
-            sql = fenced.group(1)
-
-        sql = sql.strip()
-        match = re.search(r"select\b", sql, flags=re.IGNORECASE)
-        if match:
-            return sql[match.start():].strip()
-        return sql
-
-    def _mask_rows(self, columns: List[str], rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        pii_columns = [col for col in columns if col.lower() in PII_FIELDS]
-        if not pii_columns:
+        return extract_sql(sql)
+
+    def _mask_rows(self, columns: List[str], cursor: sqlite3.Cursor) -> List[Dict[str, Any]]:
+        blocked = pii_columns(columns)
+        if blocked:
             self.logger.log(
                 "sql4_pii_guardrail_result",
-                applied=False,
-                rows=len(rows),
+                applied=True,
+                fields=blocked,
             )
-            return rows
+            raise PIIBlockError("Query includes PII columns; request blocked.", blocked)
+        data: List[Dict[str, Any]] = []
+        while batch := cursor.fetchmany():
+            data.extend(dict(zip(columns, row)) for row in batch)
         self.logger.log(
             "sql4_pii_guardrail_result",
-            applied=True,
-            fields=pii_columns,
-            rows=len(rows),
+            applied=False,
+            rows=len(data),
         )
-        raise PIIBlockError("Query includes PII columns; request blocked.", pii_columns)
+        return data
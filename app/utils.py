@@ -1,12 +1,34 @@
 from __future__ import annotations
 
+import functools
 import re
+import time
 from datetime import datetime, timedelta
-from typing import Iterable, List
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+_FENCED_SQL_RE = re.compile(r"```(?:sql)?\s*(.*?)```", re.IGNORECASE | re.DOTALL)
+_SELECT_RE = re.compile(r"select\b", re.IGNORECASE)
+_ISO_PREFIX_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+# A statement up to its terminating ';'; quoted literals/identifiers are consumed whole so a
+# ';' inside them does not end the statement ('' escapes parse as two adjacent literals).
+_SQL_STATEMENT_RE = re.compile(r"""(?:[^;'"]|'[^']*'|"[^"]*")*;""")
+
+
+# window_days -> (epoch second it was computed for, ISO cutoff string)
+_RECENT_CUTOFFS: Dict[int, Tuple[int, str]] = {}
 
 
 def is_recent(date_str: str, window_days: int = 365) -> bool:
     """Return True if the provided ISO date string is within the window."""
+    now = int(time.time())
+    cached = _RECENT_CUTOFFS.get(window_days)
+    if cached is None or cached[0] != now:
+        cutoff = (datetime.utcfromtimestamp(now) - timedelta(days=window_days)).isoformat()
+        cached = _RECENT_CUTOFFS[window_days] = (now, cutoff)
+    # Naive ISO-8601 dates/datetimes order lexicographically, so a string compare suffices.
+    if _ISO_PREFIX_RE.match(date_str) and (len(date_str) == 10 or date_str[10] in "T "):
+        # ' ' sorts before 'T', so space-separated datetimes are compared in the cutoff's shape.
+        return date_str.replace(" ", "T", 1) >= cached[1]
     try:
         dt = datetime.fromisoformat(date_str)
     except ValueError:
@@ -14,10 +36,94 @@ def is_recent(date_str: str, window_days: int = 365) -> bool:
     return datetime.utcnow() - dt <= timedelta(days=window_days)
 
 
+@functools.lru_cache(maxsize=64)
+def _keyword_pattern(keywords: FrozenSet[str]) -> Optional[re.Pattern[str]]:
+    # Trie-factored so each text position is tried against shared prefixes once, not per keyword.
+    pattern = trie_pattern(keywords)
+    return re.compile(pattern) if pattern else None
+
+
+@functools.lru_cache(maxsize=8)
+def policy_term_pattern(terms: Tuple[str, ...]) -> re.Pattern[str]:
+    """
+    Case-insensitive pattern for policy terms at a word start. No trailing boundary, so plurals
+    such as "returns" or "rules" still match. Cached, so every caller shares one compiled regex.
+    """
+    return re.compile(r"\b" + trie_pattern(terms), re.IGNORECASE)
+
+
 def keyword_match(text: str, keywords: Iterable[str]) -> bool:
-    pattern = "|".join(re.escape(k.lower()) for k in keywords)
-    return re.search(pattern, text.lower()) is not None if pattern else False
+    pattern = _keyword_pattern(frozenset(k.lower() for k in keywords))
+    return pattern is not None and pattern.search(text.lower()) is not None
+
+
+def extract_sql(text: str) -> str:
+    """Strip markdown/prose around an LLM response and return the SQL statement."""
+    text = text.strip()
+    if text[:6].lower() != "select":
+        fenced = _FENCED_SQL_RE.search(text)
+        if fenced:
+            text = fenced.group(1).strip()
+        match = _SELECT_RE.search(text)
+        if not match:
+            return text
+        text = text[match.start():]
+    end = sql_statement_end(text)
+    return (text[:end] if end != -1 else text).strip()
+
+
+def sql_statement_end(text: str, start: int = 0) -> int:
+    """Return the index just past the first unquoted ';' at or after start, or -1 if none."""
+    match = _SQL_STATEMENT_RE.match(text, start)
+    return match.end() if match else -1
+
+
+def trie_pattern(words: Iterable[str]) -> str:
+    """
+    Build a regex alternation factored as a trie, e.g. ["refund", "return"] -> "re(?:fund|turn)".
+    Shared prefixes are matched once, so the engine does not retry every word at each position.
+    """
+    trie: Dict[str, dict] = {}
+    for word in words:
+        if not word:
+            continue
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def render(node: Dict[str, dict]) -> str:
+        branches = [re.escape(char) + render(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            return "(?:" + body + ")?"
+        return body
+
+    return render(trie)
 
 
 def dedent_lines(lines: List[str]) -> str:
-    return "\n".join(line.strip() for line in lines if line.strip())
+    return "\n".join(filter(None, map(str.strip, lines)))
+
+
+def truncate_relevant(text: str, query: str, max_chars: int) -> str:
+    """
+    Cap text at max_chars by whole lines, keeping lines that mention words from the
+    query first and filling the remaining budget from the head. Line order is preserved.
+    """
+    if len(text) <= max_chars:
+        return text
+    words = set(re.findall(r"\w{3,}", query.lower()))
+    lines = text.splitlines()
+    relevant = [i for i, line in enumerate(lines) if any(word in line.lower() for word in words)]
+    keep: set[int] = set()
+    used = 0
+    for i in [*relevant, *range(len(lines))]:
+        cost = len(lines[i]) + 1
+        if i in keep or used + cost > max_chars:
+            continue
+        keep.add(i)
+        used += cost
+    return "\n".join(lines[i] for i in sorted(keep))
@@ -6,11 +6,17 @@ from datetime import datetime, timedelta
 def main() -> None:
     os.makedirs("data", exist_ok=True)
     db_path = "data/store.db"
-    conn = sqlite3.connect(db_path)
+    # Autocommit mode: the whole seed runs in the single explicit transaction opened below.
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    # Throwaway seed data: skip fsyncs and keep the rollback journal in memory.
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA journal_mode=MEMORY")
     cur = conn.cursor()
 
+    # BEGIN lives inside the script because executescript() commits any open transaction first.
     cur.executescript(
         """
+        BEGIN;
         DROP TABLE IF EXISTS order_items;
         DROP TABLE IF EXISTS orders;
         DROP TABLE IF EXISTS products;
@@ -116,13 +122,16 @@ def main() -> None:
         order_items,
     )
 
-    # Recompute totals based on order_items
+    # Recompute totals based on order_items: one grouped aggregate joined back to orders
+    # (UPDATE ... FROM, SQLite 3.33+) instead of a correlated subquery per order.
     cur.execute(
         """
         UPDATE orders
-        SET total_amount = (
-            SELECT SUM(quantity * unit_price) FROM order_items WHERE order_items.order_id = orders.id
-        )
+        SET total_amount = totals.amount
+        FROM (
+            SELECT order_id, SUM(quantity * unit_price) AS amount FROM order_items GROUP BY order_id
+        ) AS totals
+        WHERE orders.id = totals.order_id
         """
     )
 
@@ -4,6 +4,11 @@ from typing import Any, Dict
 
 from app.agent import Agent
 
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
+
 
 def pretty_print(payload: Dict[str, Any]) -> None:
     if "message" in payload:
@@ -15,14 +20,29 @@ def pretty_print(payload: Dict[str, Any]) -> None:
             print(f"\n[error] {result['error']}")
         else:
             print("\n[result]")
-            print(json.dumps(result, indent=2))
+            if orjson is not None:
+                print(orjson.dumps(result, option=orjson.OPT_INDENT_2).decode("utf-8"))
+            else:
+                print(json.dumps(result, indent=2))
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Resilient multi-tool agent demo.")
     parser.add_argument("query", nargs="?", help="User question to send to the agent")
+    parser.add_argument(
+        "--classify-batch",
+        metavar="FILE",
+        help="Classify one query per line from FILE via the OpenAI Batch API and print JSON lines",
+    )
     args = parser.parse_args()
 
+    if args.classify_batch:
+        with open(args.classify_batch, encoding="utf-8") as handle:
+            queries = [line.strip() for line in handle if line.strip()]
+        for row in Agent().classify_batch(queries):
+            print(json.dumps(row))
+        return
+
     if not args.query:
         args.query = input("Enter a query: ")
 
@@ -1,17 +1,38 @@
+import asyncio
+import functools
+import json
 import sqlite3
+import threading
 from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
 
 from app.agent import Agent
 from app.logger import TraceLogger
+from app.sql_executor import open_connection, read_schema, schema_stamp
 
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
 
-app = FastAPI(title="Resilient Multi-Tool Agent API")
+
+app = FastAPI(
+    title="Resilient Multi-Tool Agent API",
+    # orjson serializes large /query and /database payloads in C.
+    default_response_class=ORJSONResponse if orjson is not None else JSONResponse,
+)
 DB_PATH = Path("data/store.db")
 POLICY_PATH = Path("data/policies.md")
+# /database reads run on worker threads; each thread keeps its own long-lived connection.
+_DB_LOCAL = threading.local()
+# (schema stamp, [(table, columns), ...]) — introspection reruns only after DDL changes.
+_TABLES_CACHE: Optional[Tuple[str, List[Tuple[str, List[str]]]]] = None
+_TABLES_CACHE_LOCK = asyncio.Lock()
 
 app.add_middleware(
     CORSMiddleware,
@@ -26,6 +47,49 @@ class QueryRequest(BaseModel):
     query: str
 
 
+def _db_connection() -> sqlite3.Connection:
+    conn = getattr(_DB_LOCAL, "conn", None)
+    if conn is None:
+        conn = _DB_LOCAL.conn = open_connection(str(DB_PATH))
+    return conn
+
+
+def _read_tables() -> Tuple[str, List[Tuple[str, List[str]]]]:
+    conn = _db_connection()
+    stamp = schema_stamp(conn)
+    if _TABLES_CACHE is not None and _TABLES_CACHE[0] == stamp:
+        return _TABLES_CACHE
+    return stamp, [(table, [col for col, _ in cols]) for table, cols in read_schema(conn)]
+
+
+async def _table_columns() -> List[Tuple[str, List[str]]]:
+    global _TABLES_CACHE
+    async with _TABLES_CACHE_LOCK:
+        _TABLES_CACHE = await asyncio.to_thread(_read_tables)
+        return _TABLES_CACHE[1]
+
+
+def _dumps(payload: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload).encode("utf-8")
+
+
+def _read_table(table: str, columns: List[str], limit: int) -> Dict[str, Any]:
+    rows = _db_connection().execute(f"SELECT * FROM '{table}' LIMIT ?", (limit,)).fetchall()
+    return {
+        "name": table,
+        "columns": columns,
+        "rows": [dict(row) for row in rows],
+    }
+
+
+@functools.lru_cache(maxsize=1)
+def get_agent() -> Agent:
+    """Process-wide agent, built on first use; per-request traces are scoped with logger.capture()."""
+    return Agent(logger=TraceLogger())
+
+
 @app.get("/health")
 async def health() -> dict:
     return {"status": "ok"}
@@ -33,40 +97,34 @@ async def health() -> dict:
 
 @app.post("/query")
 async def run_query(payload: QueryRequest) -> dict:
-    logger = TraceLogger(record_events=True)
-    agent = Agent(logger=logger, record_events=True)
-    response = agent.handle(payload.query)
-    return {"response": response, "trace": logger.events()}
+    agent = get_agent()
+    with agent.logger.capture() as events:
+        response = await agent.handle_async(payload.query)
+    return {"response": response, "trace": events}
 
 
 @app.get("/database")
-async def database_dump(limit: int = Query(200, ge=1, le=1000)) -> dict:
+async def database_dump(limit: int = Query(200, ge=1, le=1000)) -> StreamingResponse:
     if not DB_PATH.exists():
         raise HTTPException(status_code=404, detail="Database not found")
 
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    try:
-        tables = [
-            row[0]
-            for row in conn.execute(
-                "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"
-            ).fetchall()
-        ]
-        table_payload = []
-        for table in tables:
-            columns = [row[1] for row in conn.execute(f"PRAGMA table_info('{table}')").fetchall()]
-            rows = conn.execute(f"SELECT * FROM '{table}' LIMIT ?", (limit,)).fetchall()
-            table_payload.append(
-                {
-                    "name": table,
-                    "columns": columns,
-                    "rows": [dict(row) for row in rows],
-                }
-            )
-        return {"tables": table_payload, "row_limit": limit, "table_count": len(table_payload)}
-    finally:
-        conn.close()
+    tables = await _table_columns()
+
+    async def body() -> AsyncIterator[bytes]:
+        # One table is serialized per chunk, so memory stays O(largest table); the next
+        # table's read runs on a worker thread while the current chunk is sent.
+        yield b'{"tables":['
+        pending = None
+        for index, (table, columns) in enumerate(tables):
+            read = asyncio.ensure_future(asyncio.to_thread(_read_table, table, columns, limit))
+            if pending is not None:
+                yield (b"," if index > 1 else b"") + _dumps(await pending)
+            pending = read
+        if pending is not None:
+            yield (b"," if len(tables) > 1 else b"") + _dumps(await pending)
+        yield b'],"row_limit":' + _dumps(limit) + b',"table_count":' + _dumps(len(tables)) + b"}"
+
+    return StreamingResponse(body(), media_type="application/json")
 
 
 @app.get("/policies")
@@ -0,0 +1,14 @@
+from app import pii
+
+
+def test_detect_matches_pii_terms_inside_words():
+    assert pii.detect("what is the telephone of alice") == ["phone"]
+    assert pii.detect("cellphone numbers") == ["phone"]
+
+
+def test_detect_returns_terms_in_fixed_order():
+    assert pii.detect("Show the PII: address and email") == ["email", "address", "pii"]
+
+
+def test_detect_ignores_queries_without_pii():
+    assert pii.detect("How many orders were refunded?") == []